@@ -0,0 +1,20 @@
+"""Django settings for schema extraction: upstream settings with an in-memory DB.
+
+Schema generation is pure introspection, so there is no need to connect to
+(or wait for) a real database. Loaded by extract_schema.py via
+DJANGO_SETTINGS_MODULE with this directory on PYTHONPATH. The settings
+module to wrap is named by TANDOOR_BASE_SETTINGS (default recipes.settings).
+"""
+
+import importlib
+import os
+
+_base = importlib.import_module(os.environ.get("TANDOOR_BASE_SETTINGS", "recipes.settings"))
+globals().update({k: v for k, v in vars(_base).items() if k.isupper()})
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": ":memory:",
+    }
+}
@@ -2,81 +2,237 @@
 """Compute PEP 440 version string for tandoor-client from an upstream tag.
 
 Normalizes upstream tags to three-component semver (e.g., '2.5' -> '2.5.0').
-Tracks the last-published ref in upstream_state.json.
+Tracks the last-published ref in upstream_state.json. The last upstream tag
+query is cached in an untracked .upstream_tag_cache.json next to the state
+file, so re-runs within TANDOOR_TAG_TTL seconds skip the network round-trip.
+
+Optional dependency: if dulwich is installed, upstream tags are listed
+in-process instead of spawning git. Without it, the git CLI is used.
 """
 
 import argparse
 import json
+import os
 import re
-import subprocess
 import sys
+import time
 from pathlib import Path
 
 
-def get_latest_upstream_tag(upstream_url: str) -> str:
-    """Query upstream repo for the latest semver tag."""
-    result = subprocess.run(
-        ["git", "ls-remote", "--tags", "--sort=-v:refname", upstream_url],
-        capture_output=True, text=True, check=True,
-    )
+DEFAULT_TAG_TTL = 300
+TAG_CACHE_FILENAME = ".upstream_tag_cache.json"
+
+# --exit-code status values
+EXIT_NOT_NEWER = 0
+EXIT_NEWER = 10
+
+_SEMVER_RE = re.compile(r"^\d+\.\d+(\.\d+)?\Z")
+
+
+def _ls_remote_refs(upstream_url: str) -> dict[bytes, bytes]:
+    """List upstream tag refs in-process with dulwich (no git subprocess).
+
+    Raises ImportError if dulwich (or one of its transports) is unavailable.
+    """
+    from dulwich.client import get_transport_and_path
 
-    tags = []
-    for line in result.stdout.strip().splitlines():
-        ref = line.split("\t")[1] if "\t" in line else ""
-        if ref.endswith("^{}"):
+    client, path = get_transport_and_path(upstream_url)
+    try:
+        result = client.get_refs(path, ref_prefix=[b"refs/tags/"])
+    except TypeError:
+        # Older dulwich (e.g. 0.21.x) has no ref_prefix; the caller
+        # filters on refs/tags/ anyway
+        result = client.get_refs(path)
+    # Older dulwich returns a plain dict, newer an LsRemoteResult
+    return getattr(result, "refs", result)
+
+
+def _latest_tag_from_refs(refs: dict[bytes, bytes]) -> str:
+    """Pick the highest semver tag from a mapping of ref names."""
+    keyed = []
+    for ref in refs:
+        name = ref.decode("utf-8", "replace")
+        if not name.startswith("refs/tags/") or name.endswith("^{}"):
             continue
-        tag = ref.replace("refs/tags/", "")
-        if re.match(r"^\d+\.\d+(\.\d+)?$", tag):
-            tags.append(tag)
+        tag = name.removeprefix("refs/tags/")
+        if _SEMVER_RE.match(tag):
+            keyed.append((tuple(int(p) for p in tag.split(".")), tag))
 
-    if not tags:
+    if not keyed:
         return "0.0.0"
+    return max(keyed)[1]
 
-    def sort_key(t: str) -> tuple:
-        parts = t.split(".")
-        return tuple(int(p) for p in parts)
 
-    tags.sort(key=sort_key, reverse=True)
-    return tags[0]
+def get_latest_upstream_tag(upstream_url: str) -> str:
+    """Query upstream repo for the latest semver tag.
+
+    Lists refs in-process via dulwich when it is installed. Otherwise
+    shells out to git, using protocol v2 with a ref pattern so the server
+    only advertises numeric tags, and --refs so peeled '^{}' entries are
+    never sent. That output is sorted newest-first, so it is streamed and
+    the first semver match is returned without buffering the rest.
+    """
+    try:
+        return _latest_tag_from_refs(_ls_remote_refs(upstream_url))
+    except ImportError:  # dulwich is optional; fall back to the git CLI
+        pass
+
+    import subprocess
+
+    cmd = ["git", "-c", "protocol.version=2", "ls-remote", "--refs", "--tags",
+           "--sort=-v:refname", upstream_url, "refs/tags/[0-9]*"]
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True, bufsize=1) as proc:
+        for line in proc.stdout:
+            ref = line.rstrip("\n").split("\t")[1] if "\t" in line else ""
+            tag = ref.replace("refs/tags/", "")
+            # Defensive: the server-side pattern is looser than semver
+            if _SEMVER_RE.match(tag):
+                proc.terminate()
+                return tag
+
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+    return "0.0.0"
 
 
 def normalize_tag(tag: str) -> str:
     """Ensure tag has three components (e.g., '2.5' -> '2.5.0')."""
+    if tag.count(".") == 2:
+        return tag  # already X.Y.Z
     parts = tag.split(".")
-    while len(parts) < 3:
-        parts.append("0")
-    return ".".join(parts[:3])
+    if len(parts) >= 3:
+        return ".".join(parts[:3])
+    return tag + ".0" * (3 - len(parts))
+
+
+def version_key(tag: str) -> tuple[int, ...]:
+    """Return a semver sort key for a tag (e.g., '2.5' -> (2, 5, 0))."""
+    return tuple(int(p) for p in normalize_tag(tag).split("."))
+
+
+def load_state(state_file: Path) -> dict:
+    """Read upstream_state.json, treating a missing file as empty state."""
+    if not state_file.exists():
+        return {}
+    return json.loads(state_file.read_text())
+
+
+def write_state(state_file: Path, state: dict) -> None:
+    """Atomically write a state dict back to its JSON file."""
+    tmp = state_file.with_name(state_file.name + ".tmp")
+    with tmp.open("w") as f:
+        json.dump(state, f, indent=2)
+        f.write("\n")
+    os.replace(tmp, state_file)
+
+
+def get_tag_ttl() -> int:
+    """Return the tag cache TTL in seconds (TANDOOR_TAG_TTL overrides)."""
+    value = os.environ.get("TANDOOR_TAG_TTL", str(DEFAULT_TAG_TTL))
+    try:
+        ttl = int(value)
+    except ValueError:
+        ttl = -1
+    if ttl < 0:
+        print(f"Error: TANDOOR_TAG_TTL must be a non-negative integer, got {value!r}",
+              file=sys.stderr)
+        sys.exit(1)
+    return ttl
+
+
+def load_tag_cache(cache_file: Path) -> dict:
+    """Read the tag cache, treating a missing or unreadable file as empty."""
+    try:
+        cache = json.loads(cache_file.read_text())
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def get_cached_upstream_tag(cache_file: Path, upstream_url: str,
+                            use_cache: bool = True) -> str:
+    """Return the latest upstream tag, reusing a recent query from the cache.
+
+    With use_cache=False the cache is neither read nor written.
+    """
+    if not use_cache:
+        return get_latest_upstream_tag(upstream_url)
+
+    ttl = get_tag_ttl()
+    cache = load_tag_cache(cache_file)
+    now = time.time()
+
+    if (cache.get("url") == upstream_url
+            and isinstance(cache.get("tag"), str)
+            and isinstance(cache.get("ts"), (int, float))
+            and now - cache["ts"] < ttl):
+        return cache["tag"]
+
+    tag = get_latest_upstream_tag(upstream_url)
+    # An empty listing may be a transient upstream problem; don't pin it
+    if tag != "0.0.0":
+        write_state(cache_file, {"url": upstream_url, "ts": int(now), "tag": tag})
+    return tag
 
 
 def compute_version(state_file: Path, upstream_url: str,
-                    tag_override: str | None = None) -> str:
+                    tag_override: str | None = None,
+                    use_cache: bool = True) -> str:
     """Compute the PEP 440 version from the upstream tag."""
     if tag_override:
         return normalize_tag(tag_override)
-    return normalize_tag(get_latest_upstream_tag(upstream_url))
+    cache_file = state_file.with_name(TAG_CACHE_FILENAME)
+    return normalize_tag(get_cached_upstream_tag(cache_file, upstream_url, use_cache))
 
 
-def update_state(state_file: Path, ref: str, tag: str) -> None:
+def update_state(state_file: Path, state: dict, ref: str, tag: str) -> None:
     """Update upstream_state.json with the new ref and tag."""
-    state = json.loads(state_file.read_text())
     state["last_ref"] = ref
     state["last_tag"] = tag
-    state_file.write_text(json.dumps(state, indent=2) + "\n")
+    write_state(state_file, state)
 
 
 def main() -> None:
-    parser = argparse.ArgumentParser(description="Compute version for tandoor-client")
+    parser = argparse.ArgumentParser(
+        description="Compute version for tandoor-client",
+        epilog=f"With --exit-code, exits {EXIT_NEWER} if the version is newer than last_tag "
+               f"in the state file and {EXIT_NOT_NEWER} if it is the same or older, so CI "
+               "can skip downstream work when upstream has not tagged a new release.",
+    )
     parser.add_argument("--state-file", type=Path, default=Path("upstream_state.json"))
     parser.add_argument("--upstream-url", required=True, help="Upstream git repository URL")
     parser.add_argument("--tag", help="Tag override (use this instead of querying upstream)")
     parser.add_argument("--update-ref", help="Update state with this ref after computing version")
+    parser.add_argument("--no-cache", action="store_true",
+                        help=f"Always query upstream, bypassing {TAG_CACHE_FILENAME}")
+    parser.add_argument("--exit-code", action="store_true",
+                        help=f"Exit {EXIT_NEWER} if the version is newer than the stored "
+                             f"last_tag, {EXIT_NOT_NEWER} otherwise")
     args = parser.parse_args()
 
-    version = compute_version(args.state_file, args.upstream_url, args.tag)
+    version = compute_version(args.state_file, args.upstream_url, args.tag,
+                              use_cache=not args.no_cache)
     print(version)
 
+    if not (args.update_ref or args.exit_code):
+        return
+
+    # Only parsed when actually needed, so a plain --tag run never reads it
+    state = load_state(args.state_file)
+    # Captured before update_state overwrites it
+    last_tag = state.get("last_tag")
+
     if args.update_ref:
-        update_state(args.state_file, args.update_ref, args.tag or version)
+        update_state(args.state_file, state, args.update_ref, args.tag or version)
+
+    if args.exit_code:
+        try:
+            newer = last_tag is None or version_key(version) > version_key(last_tag)
+        except ValueError:
+            print(f"Error: cannot compare {version!r} with stored last_tag {last_tag!r}",
+                  file=sys.stderr)
+            sys.exit(1)
+        sys.exit(EXIT_NEWER if newer else EXIT_NOT_NEWER)
 
 
 if __name__ == "__main__":
@@ -1,8 +1,16 @@
 #!/usr/bin/env python3
 """Extract OpenAPI schema from Tandoor Recipes using manage.py spectacular.
 
-Expects to run from inside a cloned upstream repo with deps installed
-and a PostgreSQL database available (Django checks connectivity on startup).
+Expects to run from inside a cloned upstream repo with deps installed.
+Django is pointed at _schema_settings, which loads the caller's settings
+module (DJANGO_SETTINGS_MODULE if set, else recipes.settings; handed over
+as TANDOOR_BASE_SETTINGS) and swaps the database for an in-memory SQLite
+one so no PostgreSQL server is needed.
+
+Only an allow-list of environment variables reaches Django (see
+PASSTHROUGH_ENV and PASSTHROUGH_ENV_PREFIXES). Any other Tandoor setting
+that affects INSTALLED_APPS/urls, and so the schema, must be named in
+TANDOOR_SCHEMA_ENV_PASSTHROUGH (comma- or space-separated) to be passed on.
 
 Creates a stub version_info.py if missing (normally generated at build time).
 """
@@ -13,25 +21,70 @@ import sys
 from pathlib import Path
 
 
+SCRIPTS_DIR = Path(__file__).resolve().parent
+SCHEMA_SETTINGS_MODULE = "_schema_settings"
+DEFAULT_SETTINGS_MODULE = "recipes.settings"
+
+# Environment passed through to manage.py; everything else from the (often
+# large) CI environment is dropped unless listed in PASSTHROUGH_ENV_VAR.
+PASSTHROUGH_ENV = (
+    "PATH", "HOME", "TMPDIR", "SYSTEMROOT",
+    "SECRET_KEY", "SECRET_KEY_FILE", "ALLOWED_HOSTS", "DEBUG", "DATABASE_URL",
+    "SOCIAL_PROVIDERS", "REMOTE_USER_AUTH",
+)
+PASSTHROUGH_ENV_PREFIXES = (
+    "PYTHON", "LC_", "POSTGRES_", "DJANGO_", "DB_", "ENABLE_", "LDAP_", "SOCIAL_",
+)
+PASSTHROUGH_ENV_VAR = "TANDOOR_SCHEMA_ENV_PASSTHROUGH"
+
+VERSION_INFO_STUB = (
+    '# Auto-generated stub for schema extraction\n'
+    'VERSION_NUMBER = "0.0.0"\n'
+    'BUILD_REF = "schema-extraction"\n'
+)
+
+
 def ensure_version_info(upstream_dir: Path) -> None:
     """Create stub cookbook/version_info.py if it doesn't exist."""
     version_info = upstream_dir / "cookbook" / "version_info.py"
-    if not version_info.exists():
+    try:
+        # Exclusive create: a single open() when the file is already present
+        with version_info.open("x") as f:
+            f.write(VERSION_INFO_STUB)
+    except FileNotFoundError:
         version_info.parent.mkdir(parents=True, exist_ok=True)
-        version_info.write_text(
-            '# Auto-generated stub for schema extraction\n'
-            'VERSION_NUMBER = "0.0.0"\n'
-            'BUILD_REF = "schema-extraction"\n'
-        )
-        print(f"Created stub {version_info}")
+        version_info.write_text(VERSION_INFO_STUB)
+    except FileExistsError:
+        return
+    print(f"Created stub {version_info}")
+
+
+def build_env() -> dict[str, str]:
+    """Build the minimal environment needed to boot Django for manage.py."""
+    extra = set(os.environ.get(PASSTHROUGH_ENV_VAR, "").replace(",", " ").split())
+
+    env = {"LANG": os.environ.get("LANG", "C.UTF-8")}
+    for key, value in os.environ.items():
+        if (key in PASSTHROUGH_ENV or key in extra
+                or key.startswith(PASSTHROUGH_ENV_PREFIXES)):
+            env[key] = value
+
+    # Wrap the caller's (or upstream's default) settings with an in-memory
+    # SQLite database
+    base_settings = env.get("DJANGO_SETTINGS_MODULE", DEFAULT_SETTINGS_MODULE)
+    if base_settings == SCHEMA_SETTINGS_MODULE:
+        base_settings = DEFAULT_SETTINGS_MODULE
+    env["TANDOOR_BASE_SETTINGS"] = base_settings
+    env["DJANGO_SETTINGS_MODULE"] = SCHEMA_SETTINGS_MODULE
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (str(SCRIPTS_DIR), env.get("PYTHONPATH")) if p
+    )
+    return env
 
 
 def extract_schema(upstream_dir: Path, output_file: Path) -> None:
     """Run manage.py spectacular to generate the OpenAPI schema."""
-    env = os.environ.copy()
-
-    # Ensure Django settings module is set
-    env.setdefault("DJANGO_SETTINGS_MODULE", "recipes.settings")
+    env = build_env()
 
     ensure_version_info(upstream_dir)
 
@@ -44,19 +97,15 @@ def extract_schema(upstream_dir: Path, output_file: Path) -> None:
     print(f"Running: {' '.join(cmd)}")
     print(f"Working directory: {upstream_dir}")
 
+    # Let the child inherit our stdout/stderr so its output streams live;
+    # the schema itself is written to --file.
+    sys.stdout.flush()
     result = subprocess.run(
         cmd,
         cwd=upstream_dir,
         env=env,
-        capture_output=True,
-        text=True,
     )
 
-    if result.stdout:
-        print(result.stdout)
-    if result.stderr:
-        print(result.stderr, file=sys.stderr)
-
     if result.returncode != 0:
         print(f"Schema extraction failed with exit code {result.returncode}", file=sys.stderr)
         sys.exit(1)
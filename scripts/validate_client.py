@@ -8,8 +8,6 @@ Validates that:
 4. Basic type checking passes (optional, if mypy is available)
 """
 
-import importlib
-import subprocess
 import sys
 from pathlib import Path
 
@@ -26,6 +24,8 @@ EXPECTED_MODELS = [
     "UserPreference",
 ]
 
+_MISSING = object()
+
 
 def check_import() -> bool:
     """Verify the package can be imported."""
@@ -62,6 +62,8 @@ def check_client_class() -> bool:
 
 def check_models() -> tuple[int, int]:
     """Check which expected model classes exist in the package."""
+    import importlib
+
     found = 0
     missing = 0
 
@@ -75,42 +77,49 @@ def check_models() -> tuple[int, int]:
             print("FAIL: No models module found")
             return 0, len(EXPECTED_MODELS)
 
+    # Only built if an exact lookup misses, then reused for every fuzzy match
+    names: list[tuple[str, str]] | None = None
+
     for model_name in EXPECTED_MODELS:
-        if hasattr(models_mod, model_name):
+        if getattr(models_mod, model_name, _MISSING) is not _MISSING:
             print(f"  OK: {model_name}")
             found += 1
+            continue
+
+        # Models may have different naming conventions (e.g., prefixed/suffixed)
+        # Check for partial matches
+        if names is None:
+            names = [(n, n.lower()) for n in dir(models_mod)]
+        key = model_name.lower()
+        matches = [n for n, ln in names if key in ln]
+        if matches:
+            print(f"  OK: {model_name} (as {matches[0]})")
+            found += 1
         else:
-            # Models may have different naming conventions (e.g., prefixed/suffixed)
-            # Check for partial matches
-            matches = [n for n in dir(models_mod) if model_name.lower() in n.lower()]
-            if matches:
-                print(f"  OK: {model_name} (as {matches[0]})")
-                found += 1
-            else:
-                print(f"  MISS: {model_name} not found")
-                missing += 1
+            print(f"  MISS: {model_name} not found")
+            missing += 1
 
     return found, missing
 
 
 def check_mypy(package_dir: Path) -> bool:
-    """Run mypy type checking if available."""
+    """Run mypy type checking in-process if available."""
     try:
-        result = subprocess.run(
-            [sys.executable, "-m", "mypy", "--ignore-missing-imports",
-             str(package_dir / "tandoor_client")],
-            capture_output=True, text=True, timeout=120,
-        )
-        if result.returncode == 0:
-            print("OK: mypy type check passed")
-            return True
-        else:
-            print(f"WARN: mypy found issues (non-blocking):\n{result.stdout[:500]}")
-            return True  # Non-blocking
-    except (subprocess.TimeoutExpired, FileNotFoundError):
-        print("SKIP: mypy not available or timed out")
+        from mypy import api as mypy_api
+    except ImportError:
+        print("SKIP: mypy not available")
         return True
 
+    stdout, _stderr, returncode = mypy_api.run(
+        ["--ignore-missing-imports", str(package_dir / "tandoor_client")]
+    )
+    if returncode == 0:
+        print("OK: mypy type check passed")
+        return True
+    else:
+        print(f"WARN: mypy found issues (non-blocking):\n{stdout[:500]}")
+        return True  # Non-blocking
+
 
 def main() -> None:
     print("=" * 60)